@@ -22,6 +22,8 @@ from marrow.mongo.field import Integer
 from marrow.mongo.trait import Expires, Identified, Queryable
 
 
+log = __import__('logging').getLogger(__name__)
+
 MAX_AGE = timedelta(days=2)
 
 COOKIE = CookieProfile(
@@ -65,7 +67,7 @@ class Session(MongoSessionStorage, Queryable):
 		
 		result = collection.replace_one(query, self, True)  # Upsert to create if missing.
 		if not result.raw_result['n']:
-			log.error("Unable to create or update session: " + unicode(Session.id))
+			log.error("Unable to create or update session: %s", self.id)
 		
 		return result
 	
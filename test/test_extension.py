@@ -1,10 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from threading import Event
 from webob import Request
 from webob.cookies import Cookie
 
 from web.core import Application
 from web.ext.serialize import SerializationExtension
 from web.ext.session import SessionExtension
+from web.session.memory import MemorySession
 
 
 class TestSessionExtension:
@@ -15,6 +18,16 @@ class TestSessionExtension:
 		assert 'default' in se.engines
 		assert se.engines['default'].__class__.__name__ == 'MemorySession'
 	
+	def test_construction_cookie(self):
+		cookie = {'name': 'sid'}
+		se = SessionExtension(cookie=cookie, expires=1)
+		assert se.cookie == {'name': 'sid', 'httponly': True, 'path': '/', 'max_age': 60 * 60}
+		assert cookie == {'name': 'sid'}
+	
+	def test_construction_disabled_engine(self):
+		se = SessionExtension(other=None)
+		assert set(se.engines) == {'default'}
+	
 	def test_construction_expires(self):
 		se = SessionExtension(expires=24)
 		assert se.expires == 24 * 60 * 60
@@ -105,3 +118,53 @@ class TestSessionUsage:
 		
 		contents = response.json
 		assert contents == {'_id': sid, 'name': "Alice", 'age': 27}
+	
+	def test_malformed_cookie(self, caplog):
+		req = Request.blank('/nop', cookies={'session': 'zz' + 'a' * 86})
+		resp = req.get_response(self.app)
+		assert resp.status_int == 200
+		assert resp.text == "nop"
+		assert not [record for record in caplog.records if record.levelname == 'WARNING']  # Unused; not replaced.
+	
+	def test_invalid_cookie_replaced(self, caplog):
+		req = Request.blank('/id', cookies={'session': 'zz' + 'a' * 86})
+		resp = req.get_response(self.app)
+		assert resp.status_int == 200
+		assert resp.headers.getall('Set-Cookie')
+		assert len([record for record in caplog.records if record.levelname == 'WARNING']) == 1
+
+
+class TestBackgroundPersistence:
+	class RecordingSession(MemorySession):
+		def __init__(self):
+			super().__init__()
+			self.persisted = []
+			self.release = Event()
+		
+		def persist(self, context):
+			self.release.wait()  # Hold the work pending until the test allows it to proceed.
+			self.persisted.append(str(context.session._id))
+	
+	def test_executor(self):
+		engine = self.RecordingSession()
+		ext = SessionExtension(default=engine, executor=ThreadPoolExecutor(1))
+		app = Application(TestSessionUsage.Root, extensions=[SerializationExtension(), ext])
+		
+		resp = Request.blank('/get').get_response(app)
+		assert resp.status_int == 200
+		assert not engine.persisted  # Deferred to the background.
+		
+		engine.release.set()
+		ext.stop(None)  # Drains pending work before returning.
+		assert engine.persisted == [resp.json['_id']]
+	
+	def test_after_shutdown(self):
+		engine = self.RecordingSession()
+		engine.release.set()
+		ext = SessionExtension(default=engine, executor=ThreadPoolExecutor(1))
+		app = Application(TestSessionUsage.Root, extensions=[SerializationExtension(), ext])
+		ext.stop(None)
+		
+		resp = Request.blank('/get').get_response(app)  # Requests finishing during shutdown persist synchronously.
+		assert resp.status_int == 200
+		assert engine.persisted == [resp.json['_id']]
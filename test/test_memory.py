@@ -0,0 +1,76 @@
+from time import time
+
+from web.core.context import Context
+from web.session.memory import MemorySession, PeriodicExpiration
+
+
+def expunge(pool):
+	expunge = PeriodicExpiration(pool)
+	expunge._stop = True  # Sweep only when explicitly run; don't reschedule.
+	return expunge
+
+
+class TestPeriodicExpiration:
+	def test_sweep_spares_replaced_session(self):
+		pool = {'a': Context()}  # A fresh session replacing an expired one, not yet persisted.
+		sweeper = expunge(pool)
+		sweeper.track('a', time() - 1)
+		sweeper._run()
+		
+		assert 'a' in pool
+		assert not sweeper.expiry
+	
+	def test_track_reorders(self):
+		sweeper = expunge({})
+		sweeper.track('a', 1)
+		sweeper.track('b', 2)
+		sweeper.track('a', 3)  # Refreshed; moves to the end.
+		
+		assert list(sweeper.expiry.items()) == [('b', 2), ('a', 3)]
+	
+	def test_sweep_stops_at_first_live(self):
+		now = time()
+		pool = {sid: Context(_expires=now - 1) for sid in 'abc'}
+		pool['b']._expires = now + 60
+		
+		sweeper = expunge(pool)
+		sweeper.track('a', now - 1)
+		sweeper.track('b', now + 60)
+		sweeper.track('c', now - 1)  # Out of order; only reached by a full scan.
+		sweeper.track('d', now - 1)  # Already invalidated; not in the pool.
+		sweeper._run()
+		
+		assert set(pool) == {'b', 'c'}
+		assert list(sweeper.expiry) == ['b', 'c', 'd']
+	
+	def test_sweep_tolerates_invalidated(self):
+		sweeper = expunge({})
+		sweeper.track('a', time() - 1)
+		sweeper._run()
+		
+		assert not sweeper.expiry
+	
+	def test_stop_cancels_timer(self):
+		sweeper = PeriodicExpiration({}, period=60)
+		sweeper.start()
+		timer = sweeper.timer
+		
+		assert timer.daemon
+		assert timer.is_alive()
+		
+		sweeper.stop()
+		timer.join(1)
+		
+		assert timer.finished.is_set()
+		assert not timer.is_alive()
+
+
+class TestMemorySession:
+	def test_expire_hours(self):
+		session = MemorySession(expire=2)
+		assert session._expire == 2 * 60 * 60
+		assert session._expunge.pool is session._sessions
+	
+	def test_expire_fractional_hours(self):
+		assert MemorySession(expire=0.5)._expire == 30 * 60
+		assert MemorySession(expire="0.5")._expire == 30 * 60
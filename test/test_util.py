@@ -0,0 +1,49 @@
+from hashlib import sha256
+from hmac import new as hmac
+
+from pytest import raises
+
+from web.session.util import SignatureError, SignedSessionIdentifier, Signer
+
+
+class TestSigner:
+	def test_matches_hmac(self):
+		sign = Signer("secret")
+		assert sign(b"message") == hmac(b"secret", b"message", sha256).hexdigest().encode('ascii')
+	
+	def test_reusable(self):
+		sign = Signer(b"secret")
+		assert sign(b"first") != sign(b"second")
+		assert sign(b"first") == sign(b"first")
+
+
+class TestSignedSessionIdentifier:
+	def test_round_trip(self):
+		sign = Signer("secret")
+		identifier = SignedSessionIdentifier(mac=sign)
+		token = identifier.signed.decode('ascii')
+		
+		assert len(token) == 88
+		assert str(SignedSessionIdentifier(token, mac=sign)) == str(identifier)
+		assert str(SignedSessionIdentifier(token, secret="secret")) == str(identifier)
+	
+	def test_tampered(self):
+		token = SignedSessionIdentifier(secret="secret").signed.decode('ascii')
+		
+		with raises(SignatureError):
+			SignedSessionIdentifier(token, secret="other")
+		
+		with raises(SignatureError):
+			SignedSessionIdentifier(token[:-1], secret="secret")
+	
+	def test_malformed(self):
+		with raises(SignatureError):
+			SignedSessionIdentifier('zz' + 'a' * 86, secret="secret")
+		
+		with raises(SignatureError):
+			SignedSessionIdentifier('a' * 87 + '\u00e9', secret="secret")
+	
+	def test_malformed_hex(self):
+		for value in (' 000000a', '0000_001'):  # Accepted by int(..., 16), rejected by unhexlify.
+			with raises(SignatureError):
+				SignedSessionIdentifier(value + '0' * 80, secret="secret")
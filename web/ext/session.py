@@ -1,20 +1,28 @@
 """Session handling extension utilizing pluggable session data storage engines."""
 
-from os import urandom
 from weakref import proxy
-from binascii import hexlify
+from secrets import token_hex
 from datetime import timedelta
 from functools import partial
+from types import MappingProxyType
 
 from ..core.util import lazy
 from ..core.context import ContextGroup
 from ..session.memory import MemorySession
-from ..session.util import SignatureError, SignedSessionIdentifier
+from ..session.util import SignatureError, SignedSessionIdentifier, Signer
 
 
 log = __import__('logging').getLogger(__name__)
 
 
+class SessionGroup(ContextGroup):
+	"""The group of session engines, noting when any engine stores its loaded data for the current request."""
+	
+	def __setitem__(self, name, value):
+		super().__setitem__(name, value)
+		self.__dict__['_accessed'] = True
+
+
 class SessionExtension(object):
 	"""Client session management extension.
 	
@@ -27,12 +35,17 @@ class SessionExtension(object):
 	below for details.
 	"""
 	
-	__slots__ = ('provides', 'needs', 'uses', '__secret', 'refreshes', 'cookie', 'engines', 'expires')
+	__slots__ = ('provides', 'needs', 'uses', '__mac', 'refreshes', 'cookie', '_cookie_name', 'engines', 'expires',
+			'_handlers', '_group', '_executor', 'graceful', 'dispatch', 'before', 'mutate', 'interactive',
+			'inspect')
 	
 	_provides = {'session'}  # We provide this feature to the application.
 	_needs = {'request'}  # We depend on the cookie-setting power of the `context.response` object.
+	_signals = frozenset({'graceful', 'dispatch', 'before', 'mutate', 'interactive', 'inspect'})  # Passed through.
+	_events = _signals | {'start', 'prepare', 'after', 'done', 'stop', 'persist'}  # All callbacks issued to engines.
 	
-	def __init__(self, secret=None, default=None, auto=False, expires=None, cookie=None, refresh=True, **engines):
+	def __init__(self, secret=None, default=None, auto=False, expires=None, cookie=None, refresh=True, executor=None,
+			**engines):
 		"""Configure session management extension and prepare engines.
 		
 		The first positional argument is `secret`, the application-secret value used as the cryptographic basis for
@@ -54,10 +67,16 @@ class SessionExtension(object):
 		value falsy if you want your sessions to have a fixed lifespan from initial creation, otherwise it will
 		expire only after it has been abandoned for that duration.
 		
+		An optional `executor`, such as a `concurrent.futures.ThreadPoolExecutor` instance, may be given to have
+		session data persisted in the background, freeing the request thread to serve the next request immediately.
+		Pending work is completed on application shutdown. Otherwise, session data is persisted synchronously. No
+		snapshot is taken; when using an executor, engine `persist` callbacks must tolerate running concurrently with
+		later requests for the same session.
+		
 		Additional keyword arguments are used as session engines assigned as lazily loaded attributes of the
 		`context.session` object. Individual engines may have their own expiry controls in addition to the global
 		setting made here. (There is never a point in setting a specific engine's expiry time to be longer than the
-		global.)
+		global.) Engines given as `None` are omitted, allowing configuration to disable them.
 		"""
 		
 		super().__init__()
@@ -66,23 +85,26 @@ class SessionExtension(object):
 			if not __debug__:  # pragma: no cover
 				raise ValueError("A secret must be defined in production environments.")
 			
-			secret = hexlify(urandom(64)).decode('ascii')
-			log.warn("Generating temporary session secret; sessions will not persist between restarts.", extra=dict(
+			secret = token_hex(64)
+			log.warning("Generating temporary session secret; sessions will not persist between restarts.", extra=dict(
 					secret = secret,
 				))
 		
 		self.refreshes = refresh
-		self.__secret = secret
-		self.cookie = cookie = cookie or dict()
-		self.engines = engines
+		self.__mac = Signer(secret)  # Prepare the keyed digest once, rather than on every request.
+		cookie = dict(cookie or ())  # Our own copy; the caller's mapping is left untouched.
 		self.expires = None
+		self._executor = executor
 		
 		engines['default'] = default or MemorySession()
+		self.engines = engines = {name: engine for name, engine in engines.items() if engine is not None}
 		
 		cookie.setdefault('name', 'session')
 		cookie.setdefault('httponly', True)
 		cookie.setdefault('path', '/')
 		
+		self._cookie_name = cookie['name']
+		
 		if expires:  # We need the expiry time in seconds.
 			if hasattr(expires, 'isdigit') or isinstance(expires, (int, float)):
 				self.expires = expires = int(expires) * 60 * 60
@@ -92,6 +114,8 @@ class SessionExtension(object):
 			
 			cookie.setdefault('max_age', expires)
 		
+		self.cookie = MappingProxyType(cookie)  # Final; prepared once, then passed as-is to each `set_cookie` call.
+		
 		# Calculated updated extension dependency graphing metadata.
 		self.uses = set()
 		self.needs = set(self._needs)
@@ -104,51 +128,62 @@ class SessionExtension(object):
 			self.uses.update(getattr(engine, 'uses', ()))
 			self.needs.update(getattr(engine, 'needs', ()))
 			self.provides.update(getattr(engine, 'provides', ()))
+		
+		# Determine which engines implement each event once, rather than probing for them on each dispatch.
+		self._handlers = {event: tuple((name, getattr(engine, event)) for name, engine in engines.items()
+				if hasattr(engine, event)) for event in self._events}
+		
+		# Pass the signals we don't otherwise use on to any engines that implement them, binding each only once.
+		for signal in self._signals:
+			if self._handlers[signal]:
+				setattr(self, signal, partial(self._handle_event, True, signal))
 	
 	def _get_session_id(self, session):
-		"""Lazily get the session id for the current request.
+		"""Lazily issue a new session id for the current request.
 		
-		The `session` passed to this function is the bound SessionGroup instance containing the lazy engines.
+		The `session` passed to this function is the bound SessionGroup instance containing the lazy engines. Any
+		identifier presented by cookie has already been checked in `prepare`; this is only reached if there was none, or
+		it failed to validate, so the cookie is never examined twice.
 		"""
 		
-		identifier = None
-		token = session._ctx.request.cookies.get(self.cookie['name'], None)
+		rejected = session.__dict__.get('_rejected', None)
 		
-		if token:
-			try:
-				identifier = SignedSessionIdentifier(token, secret=self.__secret, expires=self.expires)
-			
-			except SignatureError as e:
-				log.warn("Session signature failed to validate: " + str(e))
-			
-			else:
-				if __debug__:
-					log.debug("Retrieved valid session token from cookie.")
-			
-			# TODO: Verify here that the session does, actually, exist in at least one engine.
-			# This would help avoid "session fixation" issues.
+		if rejected:  # Reported here, once, rather than on every request still presenting the stale cookie.
+			log.warning("Session signature failed to validate, issuing replacement: %s", rejected)
 		
-		if not identifier:
-			identifier = SignedSessionIdentifier(secret=self.__secret, expires=self.expires)
-			session['_new'] = True
-			
-			if __debug__:
-				log.debug("No existing session identifier; generated new.")
+		elif __debug__:
+			log.debug("No existing session identifier; generated new.")
+		
+		identifier = SignedSessionIdentifier(mac=self.__mac, expires=self.expires)
 		
 		session.__dict__['_id'] = identifier
+		session.__dict__['_new'] = True
 		session.__dict__['_accessed'] = True
 		return identifier
 	
+	def _was_accessed(self, session):
+		"""Identify if the session was used during this request.
+		
+		That is, if the identifier was lazily resolved or generated, or any engine's data was loaded. Reading an
+		identifier already resolved from a valid cookie in `prepare` does not count.
+		"""
+		
+		# Engines record their data through item assignment, which flags the group; fall back on inspection.
+		return session._accessed or not self.engines.keys().isdisjoint(session.__dict__)
+	
 	def start(self, context):
 		"""Called to prepare attributes on the ApplicationContext."""
 		
 		# Construct lazy bindings for each configured session extension.
-		context.session = ContextGroup(**self.engines)
+		context.session = SessionGroup(**self.engines)
 		
 		# Also lazily construct the session ID on first request.
 		context.session.__dict__['_id'] = lazy(self._get_session_id, '_id')
 		context.session.__dict__['_ctx'] = proxy(context)  # Bind this promoted SessionGroup to the application context.
 		
+		# Promote once, here, so that each request only needs to instantiate the resulting SessionGroup class.
+		self._group = context.session._promote('SessionGroup', False)
+		
 		# Notify the engines.
 		self._handle_event(True, 'start', context=context)
 	
@@ -162,14 +197,28 @@ class SessionExtension(object):
 			log.debug("Preparing session group.")
 			# __import__('wdb').set_trace()
 		
-		context.session = context.session._promote('SessionGroup')  # Allow the lazy descriptor to run from the class.
-		context.session.__dict__.update(
+		context.session = session = self._group()  # Allow the lazy descriptor to run from the class.
+		session.__dict__.update(
 					_ctx = proxy(context),  # Bind this promoted SessionGroup to the request context.
 					_engines = self.engines, # Access to engines without triggering __getitem__ on SessionGroup.
 					_new = False,  # Identify if this is a brand new session.
 					_accessed = False,  # Identify if any attempt has been made to access session data.
+					_rejected = None,  # The reason a presented session cookie failed to validate, if it did.
 				)
 		
+		# Returning visitors are the common case; resolve their identifier now rather than through the lazy lookup.
+		token = context.request.cookies.get(self._cookie_name, None)
+		
+		if token:
+			try:
+				session.__dict__['_id'] = SignedSessionIdentifier(token, mac=self.__mac, expires=self.expires)
+			
+			except SignatureError as e:  # Leave it to the lazy lookup, which will issue a replacement if used.
+				session.__dict__['_rejected'] = e
+			
+			# TODO: Verify here that the session does, actually, exist in at least one engine.
+			# This would help avoid "session fixation" issues.
+		
 		self._handle_event(True, 'prepare', context)
 	
 	def after(self, context):
@@ -181,15 +230,17 @@ class SessionExtension(object):
 		# Allow engines to clean up if needed; first, this time, to act as a middleware stack.
 		self._handle_event(True, 'after', context)
 		
+		session = context.session
+		
 		# No work to do unless the session is new or we're told to refresh the cookie.
-		if not context.session._new or not self.refreshes:
+		if not session._new or not self.refreshes:
 			return
 		
-		if not context.session._accessed:
+		if not self._was_accessed(session):
 			return  # No more work to do if the session was never accessed.
 		
 		# Assign the cookie (string value of our signed token) via the WebOb Response object.
-		context.response.set_cookie(value=context.session._id.signed, **self.cookie)
+		context.response.set_cookie(value=session._id.signed, **self.cookie)
 	
 	def done(self, context):
 		"""Called after the response has been fully sent to the client.
@@ -200,12 +251,41 @@ class SessionExtension(object):
 		# Allow engines to clean up if needed.
 		self._handle_event(True, 'done', context)
 		
-		if not context.session._accessed:
+		if not self._was_accessed(context.session):
 			return  # Bail early if the session was never accessed.
 		
+		if self._executor:  # Hand the work off, so this thread may move on to the next request.
+			try:
+				future = self._executor.submit(self._handle_event, False, 'persist', context)
+			
+			except RuntimeError:  # The executor has been shut down; requests finishing during shutdown persist here.
+				pass
+			
+			else:
+				future.add_done_callback(self._persisted)
+				return
+		
 		# Inform session engines that had their data touched to persist any changes.
 		self._handle_event(False, 'persist', context)
 	
+	def stop(self, context):
+		"""Called on application shutdown.
+		
+		Any outstanding background persistence is completed prior to the engines being notified.
+		"""
+		
+		if self._executor:
+			self._executor.shutdown()
+		
+		self._handle_event(True, 'stop', context)
+	
+	@staticmethod
+	def _persisted(future):
+		"""Report failure of background persistence, which would otherwise pass silently."""
+		
+		if future.exception():
+			log.error("Unable to persist session data.", exc_info=future.exception())
+	
 	def _handle_event(self, all, event, context, *args, **kw):
 		"""Send a signal to all, or only accessed session engines.
 		
@@ -218,26 +298,9 @@ class SessionExtension(object):
 		be passed through to the callbacks themselves.
 		"""
 		
-		# Determine the set of engines we're sending signals to.
-		engines = self.engines.items()
-		
-		if not all:  # Restrict to only accessed engines.
-			accessed = set(context.session.__dict__) & set(self.engines)
-			engines = ((name, engine) for name, engine in engines if name in accessed)
-		
-		# Call the event callback, if present in the engine.
-		for name, engine in engines:
-			if hasattr(engine, event):
-				getattr(engine, event)(context, *args, **kw)
-	
-	def __getattr__(self, name):
-		"""Pass any signals SessionExtension doesn't use on to SessionEngines"""
-		
-		if name.startswith('_'):  # Deny access to private attributes.
-			raise AttributeError()
-		
-		for engine in self.engines.values():
-			if name in dir(engine):
-				return partial(self._handle_event, True, name)
+		accessed = None if all else context.session.__dict__  # Accessed engines have their data stored here.
 		
-		raise AttributeError()
+		# Call the event callback of each engine implementing it, restricting to only accessed engines if requested.
+		for name, handler in self._handlers[event]:
+			if all or name in accessed:
+				handler(context, *args, **kw)
@@ -1,7 +1,9 @@
 """Session handling extension using session engines."""
 
+from time import time
 from threading import Lock, Timer
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import timedelta
 
 from web.core.context import Context
 
@@ -11,11 +13,16 @@ log = __import__('logging').getLogger(__name__)
 
 
 class PeriodicExpiration:
-	"""Periodically clean up stale sessions."""
+	"""Periodically clean up stale sessions.
+	
+	Sessions share a single lifetime, so ordering them by when their expiry was last set also orders them by expiry
+	time; each sweep only needs to visit the sessions that have actually expired, plus the first that has not.
+	"""
 	
 	def __init__(self, pool, period=60):
 		super().__init__()
 		self.pool = pool
+		self.expiry = OrderedDict()  # Session IDs mapped to their expiry time, soonest first.
 		self._stop = False
 		self.period = period
 		self.timer = None
@@ -28,19 +35,34 @@ class PeriodicExpiration:
 		with self.lock:
 			self.timer = None
 		
-		cull = set()  # The set of session IDs to remove.
-		now = datetime.utcnow()
+		now = time()
 		
-		for sid in self.pool:
-			if '_expires' not in self.pool[sid]: continue
-			if self.pool[sid]['_expires'] <= now:
-				cull.add(sid)
+		cull = []  # The session IDs to remove.
 		
-		for sid in cull:  # Can't remove while iterating above...
-			del self.pool[sid]
+		with self.lock:
+			for sid, expires in self.expiry.items():
+				if expires > now:
+					break  # Everything from here on out expires later.
+				
+				cull.append(sid)
+			
+			for sid in cull:  # Can't remove while iterating above...
+				del self.expiry[sid]
+				session = self.pool.get(sid, ())  # May have already been explicitly invalidated.
+				
+				# The stored session may have been replaced since being tracked; only remove it if it really expired.
+				if '_expires' in session and session['_expires'] <= now:
+					self.pool.pop(sid, None)
 		
 		self.schedule()
 	
+	def track(self, sid, expires):
+		"""Record the updated expiry time of the given session."""
+		
+		with self.lock:
+			self.expiry.pop(sid, None)
+			self.expiry[sid] = expires
+	
 	def schedule(self):
 		if self._stop:
 			return
@@ -48,6 +70,7 @@ class PeriodicExpiration:
 		with self.lock:
 			self.timer = Timer(self.period, self._run)
 			self.timer.name = "memory-session-expunge"
+			self.timer.daemon = True  # Don't hold up interpreter shutdown.
 		
 		self.timer.start()
 	
@@ -55,7 +78,7 @@ class PeriodicExpiration:
 		self._stop = True
 		
 		if self.timer:
-			self.timer.stop()
+			self.timer.cancel()
 
 
 class MemorySession:
@@ -65,14 +88,15 @@ class MemorySession:
 		super().__init__()
 		self._sessions = {}
 		
-		if expire and hasattr(expire, 'isdigit') and expire.isdigit():
-			expire = timedelta(hours=expire)
+		if expire and (hasattr(expire, 'isdigit') or isinstance(expire, (int, float))):
+			expire = timedelta(hours=float(expire))  # Normalize once; hours, as per the extension's `expires`.
 		
-		self._expire = expire
+		# Lifetime in seconds; `_expires` stamps are POSIX timestamps.
+		self._expire = expire.total_seconds() if expire else None
 		self._refresh = refresh
 		
 		if expire:
-			self._expunge = PeriodicExpiration()
+			self._expunge = PeriodicExpiration(self._sessions)
 	
 	def start(self, context):
 		"""Spawn the auto-expunge thread on startup if configured to do so."""
@@ -96,7 +120,7 @@ class MemorySession:
 		if session is None:
 			return self
 		
-		now = datetime.utcnow()
+		now = time()
 		sid = str(session._id)
 		
 		if sid not in self._sessions:
@@ -127,6 +151,9 @@ class MemorySession:
 		if __debug__:
 			log.debug("Persisting in-memory session.")
 		
-		if self._expire and (self._refresh or '_expires' not in getattr(context.session, self.name)):
-			getattr(context.session, self.name)._expires = datetime.utcnow() + self._expire
+		session = getattr(context.session, self.name)
+		
+		if self._expire and (self._refresh or '_expires' not in session):
+			session._expires = time() + self._expire
+			self._expunge.track(str(context.session._id), session._expires)
 
@@ -1,11 +1,13 @@
 """Release information about WebCore Sessions."""
 
-import sys
 from collections import namedtuple
 
 
 version_info = namedtuple('version_info', ('major', 'minor', 'micro', 'releaselevel', 'serial'))(3, 0, 0, 'final', 0)
-version = ".".join([str(i) for i in version_info[:3]]) + ((version_info.releaselevel[0] + str(version_info.serial)) if version_info.releaselevel != 'final' else '')
+version = f"{version_info.major}.{version_info.minor}.{version_info.micro}"
+
+if version_info.releaselevel != 'final':
+	version += f"{version_info.releaselevel[0]}{version_info.serial}"
 
 author = namedtuple('Author', ['name', 'email'])("Alice Bevan-McGregor", 'alice@gothcandy.com')
 description = "Generalized session abstraction and basic engines for the WebCore web framework."
@@ -1,11 +1,11 @@
-from hashlib import md5, sha256
+from hashlib import md5
 from hmac import compare_digest, new as hmac
-from binascii import unhexlify
+from binascii import hexlify, unhexlify
 from os import getpid
 from socket import gethostname
 from time import time
 from random import randint
-from threading import RLock
+from itertools import count
 
 
 log = __import__('logging').getLogger(__name__)
@@ -17,20 +17,36 @@ class SignatureError(ValueError):
 	pass
 
 
+class Signer:
+	"""A reusable HMAC-SHA256 signing callable keyed with an application secret.
+	
+	The keyed inner and outer digest states are prepared once, on construction; each signature only copies that
+	prepared state instead of repeating the key schedule. Called with the message to sign, returns the hexadecimal
+	signature as bytes.
+	"""
+	
+	__slots__ = ('_keyed', )
+	
+	def __init__(self, secret):
+		self._keyed = hmac(secret.encode('ascii') if hasattr(secret, 'encode') else secret, digestmod='sha256')
+	
+	def __call__(self, message):
+		mac = self._keyed.copy()
+		mac.update(message)
+		return mac.hexdigest().encode('ascii')
+
+
 class Counter:
+	__slots__ = ('_count', )
+	
 	def __init__(self):
-		self.value = randint(0, 2**24)
-		self.lock = RLock()
+		self._count = count(randint(0, 0xFFFFFF))  # Advanced atomically in C; no lock required.
 	
 	def __iter__(self):
 		return self
 	
 	def __next__(self):
-		with self.lock:
-			self.value = (self.value + 1) % 0xFFFFFF
-			value = self.value
-		
-		return value
+		return next(self._count) & 0xFFFFFF
 	
 	next = __next__
 
@@ -38,7 +54,11 @@ counter = Counter()
 
 
 class SessionIdentifier:
+	__slots__ = ('time', 'machine', 'process', 'counter', '_packed', '_str')
+	
 	def __init__(self, value=None):
+		self._str = None
+		
 		if value:
 			self.parse(value)
 		else:
@@ -49,28 +69,34 @@ class SessionIdentifier:
 		self.machine = int(value[8:14], 16)
 		self.process = int(value[14:18], 16)
 		self.counter = int(value[18:24], 16)
+		self._packed = unhexlify(value[:24])
 	
 	def generate(self):
 		self.time = int(time())
 		self.machine = MACHINE
 		self.process = getpid() % 0xFFFF
 		self.counter = next(counter)
+		self._packed = (self.time.to_bytes(4, 'big') + self.machine.to_bytes(3, 'big') +
+				self.process.to_bytes(2, 'big') + self.counter.to_bytes(3, 'big'))
 	
 	def __bytes__(self):
 		return str(self).encode('ascii')
 	
 	def __str__(self):
-		return f"{self.time:08x}{self.machine:06x}{self.process:04x}{self.counter:06x}"
+		if self._str is None:  # Serialized once, from the packed form, then reused.
+			self._str = hexlify(self._packed).decode('ascii')
+		
+		return self._str
 	
 	def __repr__(self):
 		return f"{self.__class__.__name__}('{self}')"
 
 
 class SignedSessionIdentifier(SessionIdentifier):
-	__slots__ = ('__secret', '__signature', 'expires')
+	__slots__ = ('__mac', '__signature', 'expires')
 	
-	def __init__(self, value=None, secret=None, expires=None):
-		self.__secret = secret.encode('ascii') if hasattr(secret, 'encode') else secret
+	def __init__(self, value=None, secret=None, expires=None, mac=None):
+		self.__mac = mac or Signer(secret)
 		self.__signature = None
 		self.expires = expires
 		
@@ -80,9 +106,12 @@ class SignedSessionIdentifier(SessionIdentifier):
 		if len(value) != 88:
 			raise SignatureError("Invalid signed identifier length.")
 		
-		super().parse(value)
+		try:
+			super().parse(value)
+			self.__signature = value[24:].encode('ascii')
 		
-		self.__signature = value[24:].encode('ascii')
+		except ValueError as e:  # Includes binascii.Error and UnicodeEncodeError; malformed client input.
+			raise SignatureError("Malformed signed identifier.") from e
 		
 		if not self.valid:
 			raise SignatureError("Invalid signed identifier.")
@@ -94,14 +123,7 @@ class SignedSessionIdentifier(SessionIdentifier):
 	@property
 	def signature(self):
 		if not self.__signature:
-			self.__signature = hmac(
-					self.__secret,
-					unhexlify(bytes(self)),
-					sha256
-				).hexdigest()
-			
-			if hasattr(self.__signature, 'encode'):
-				self.__signature = self.__signature.encode('ascii')
+			self.__signature = self.__mac(self._packed)
 		
 		return self.__signature
 	
@@ -115,19 +137,8 @@ class SignedSessionIdentifier(SessionIdentifier):
 			raise SignatureError("Expired signature.")
 			return False
 		
-		challenge = hmac(
-				self.__secret,
-				unhexlify(bytes(self)),
-				sha256
-			).hexdigest()
-		
-		if hasattr(challenge, 'encode'):
-			challenge = challenge.encode('ascii')
-		
-		result = compare_digest(challenge, self.signature)
-		
-		if not result:
-			raise SignatureError("Invalid signature:", repr(challenge), repr(self.signature))
+		if not compare_digest(self.__mac(self._packed), self.__signature):
+			raise SignatureError("Invalid signature.")
 			return False
 		
 		return True